@@ -6,4 +6,9 @@ setup(
     url="https://yrck.nl",
     author='Y. de Boer',
     packages=['winlogbeatserver'],
+    entry_points={
+        'console_scripts': [
+            'winlogbeatserver = winlogbeatserver.winlogbeatserver:main',
+        ],
+    },
 )
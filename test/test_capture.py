@@ -0,0 +1,54 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'winlogbeatserver'))
+
+import capture  # noqa: E402
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(HERE, 'test_bulk.json'), 'rb') as f:
+            self.body = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, count, segment_size=capture.SEGMENT_SIZE):
+        recorder = capture.BulkRecorder(self.directory, segment_size)
+        for _ in range(count):
+            recorder.record(self.body)
+        recorder.close()
+
+    def test_roundtrip_over_segments(self):
+        self.record(5, segment_size=len(self.body) * 2)
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        self.assertEqual(list(capture.iter_segments(self.directory)), [self.body] * 5)
+
+    def test_truncated_record_is_skipped(self):
+        self.record(2)
+        with open(os.path.join(self.directory, 'bulk-000000.seg'), 'ab') as f:
+            f.write(capture.LENGTH.pack(100) + b'short')
+        self.assertEqual(list(capture.iter_segments(self.directory)), [self.body] * 2)
+
+    def test_record_after_close_is_ignored(self):
+        recorder = capture.BulkRecorder(self.directory)
+        recorder.record(self.body)
+        recorder.close()
+        recorder.record(self.body)
+        self.assertEqual(list(capture.iter_segments(self.directory)), [self.body])
+
+    def test_refuses_existing_recording(self):
+        self.record(1)
+        self.assertRaises(ValueError, capture.BulkRecorder, self.directory)
+        self.assertRaises(ValueError, capture.check_record_dir, os.path.join(self.directory, 'missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'winlogbeatserver'))
+
+import filters  # noqa: E402
+import parse  # noqa: E402
+
+
+def fixture(name):
+    with open(os.path.join(HERE, name)) as f:
+        return f.read()
+
+
+def bulk_documents():
+    return [d for d in fixture('test_bulk.json').rstrip().split('\n') if len(d) > 100]
+
+
+def syscall_document(pid, syscall):
+    j = next(json.loads(d) for d in bulk_documents() if parse.parse_event(d)[0] == parse.EventTypes.SYSCALL)
+    j['winlog']['event_data'].update({'pid': pid, 'syscall': syscall})
+    return json.dumps(j)
+
+
+def replay(rules, documents):
+    return [parse.parse_row(d, rules) for d in documents]
+
+
+def syscalls(rows):
+    return [event_data['syscall'] for opcode, event_data, _ in rows if opcode == parse.EventTypes.SYSCALL]
+
+
+class TestFilterRules(unittest.TestCase):
+
+    def test_without_rules(self):
+        rows = replay(None, bulk_documents())
+        self.assertEqual(syscalls(rows), ['24', '85', '24', '85', '24', '85', '24', '85', '24', '85', '24', '24',
+                                          '85', '29'])
+
+    def test_deny_syscall(self):
+        rules = filters.FilterRules(deny={'syscall': [24]})
+        rows = replay(rules, bulk_documents())
+        self.assertNotIn('24', syscalls(rows))
+        self.assertIn('85', syscalls(rows))
+        self.assertEqual(rules.dropped, {('deny', 'syscall', '24'): 7})
+
+    def test_allow_syscall_keeps_other_events(self):
+        rules = filters.FilterRules(allow={'syscall': ['85']})
+        rows = replay(rules, bulk_documents())
+        self.assertEqual(set(syscalls(rows)), {'85'})
+        opcodes = [opcode for opcode, _, _ in rows]
+        self.assertIn(parse.EventTypes.STATUS, opcodes)
+        self.assertIn(parse.EventTypes.THREAD, opcodes)
+        self.assertIn(parse.EventTypes.PROCESS, opcodes)
+        self.assertEqual(rules.dropped[('allow', 'syscall', '24')], 7)
+        self.assertEqual(rules.dropped[('allow', 'syscall', '29')], 1)
+
+    def test_rate_limit_syscall(self):
+        rules = filters.FilterRules(rate_limit={'syscall': {'24': 2}})
+        rows = replay(rules, bulk_documents())
+        # All syscall events in the fixture fall in the same second
+        self.assertEqual(syscalls(rows).count('24'), 2)
+        self.assertEqual(rules.dropped, {('rate_limit', 'syscall', '24'): 5})
+
+    def test_sample_syscall(self):
+        rules = filters.FilterRules(sample={'syscall': {'85': 2}})
+        rows = replay(rules, bulk_documents())
+        self.assertEqual(syscalls(rows).count('85'), 3)
+        self.assertEqual(rules.dropped, {('sample', 'syscall', '85'): 3})
+
+    def test_process_event_names_creating_process(self):
+        rules = filters.FilterRules(deny={'process': ['SVCHOST.EXE']})
+        rows = replay(rules, [fixture('test_process.json'), syscall_document('2532', '24'),
+                              syscall_document('1376', '24')])
+        self.assertEqual([opcode for opcode, _, _ in rows],
+                         [parse.EventTypes.FILTERED, parse.EventTypes.SYSCALL, parse.EventTypes.FILTERED])
+
+    def test_thread_event_names_own_process(self):
+        rules = filters.FilterRules(allow={'process': ['dxgiadaptercache.exe']})
+        rows = replay(rules, [fixture('test_process.json'), fixture('test_thread.json'),
+                              syscall_document('2532', '24'), syscall_document('1376', '24')])
+        self.assertEqual([opcode for opcode, _, _ in rows],
+                         [parse.EventTypes.FILTERED, parse.EventTypes.THREAD, parse.EventTypes.SYSCALL,
+                          parse.EventTypes.FILTERED])
+
+    def test_allow_process_drops_unknown_pids(self):
+        rules = filters.FilterRules(allow={'process': ['sc.exe']})
+        rows = replay(rules, bulk_documents() + [syscall_document('4548', '85')])
+        # Only the last syscall comes after the thread event naming pid 4548 sc.exe
+        self.assertEqual(syscalls(rows), ['85'])
+        self.assertIn(parse.EventTypes.STATUS, [opcode for opcode, _, _ in rows])
+        self.assertEqual(rules.dropped[('allow', 'process', filters.UNKNOWN_PROCESS)], 14)
+
+    def test_invalid_counts(self):
+        self.assertRaises(ValueError, filters.FilterRules, sample={'syscall': {'85': 0}})
+        self.assertRaises(ValueError, filters.FilterRules, rate_limit={'syscall': {'85': -1}})
+        self.assertRaises(ValueError, filters.FilterRules, deny={'name': ['sc.exe']})
+
+    def test_rule_errors_keep_event(self):
+        class Broken(object):
+            def accept(self, opcode, datatime, event_data):
+                raise RuntimeError('broken')
+
+        rows = replay(Broken(), [syscall_document('2532', '24')])
+        self.assertEqual(rows[0][0], parse.EventTypes.SYSCALL)
+        self.assertIsNotNone(rows[0][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
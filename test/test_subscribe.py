@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'winlogbeatserver'))
+
+import parse  # noqa: E402
+import subscribe  # noqa: E402
+
+
+def fixture(name):
+    with open(os.path.join(HERE, name)) as f:
+        return f.read()
+
+
+def rows():
+    documents = [d for d in fixture('test_bulk.json').rstrip().split('\n') if len(d) > 100]
+    documents += [fixture('test_process.json'), fixture('test_thread.json')]
+    return [parse.parse_row(d) for d in documents]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.01)
+
+
+def read_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return b''.join(chunks).decode('utf-8')
+        chunks.append(chunk)
+
+
+class TestSubscriptionServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'events.sock')
+        self.clients = []
+
+    def tearDown(self):
+        for c in self.clients:
+            c.close()
+        shutil.rmtree(self.directory)
+
+    def subscribe(self, hub, selection):
+        c = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        c.connect(self.path)
+        c.sendall(json.dumps(selection).encode('utf-8') + b'\n')
+        self.clients.append(c)
+        count = len(self.clients)
+        wait_for(lambda: len(hub.subscribers) == count)
+        return c
+
+    def test_selection_and_format(self):
+        hub = subscribe.SubscriptionServer(self.path)
+        hub.start()
+        process = self.subscribe(hub, {'types': [parse.EventTypes.PROCESS]})
+        pid = self.subscribe(hub, {'pids': [4548]})
+        everything = self.subscribe(hub, {})
+
+        events = rows()
+        for opcode, event_data, csv_row in events:
+            hub.publish(opcode, event_data, csv_row)
+        # A normal close delivers everything buffered
+        hub.close()
+        self.assertFalse(os.path.exists(self.path))
+
+        def expected(predicate):
+            return ''.join('{},{}'.format(opcode, csv_row) for opcode, event_data, csv_row in events
+                           if csv_row is not None and predicate(opcode, event_data))
+
+        self.assertEqual(read_all(process), expected(lambda opcode, _: opcode == parse.EventTypes.PROCESS))
+        self.assertEqual(read_all(pid), expected(lambda _, event_data: event_data.get('pid') == '4548'))
+        lines = read_all(everything)
+        self.assertEqual(lines, expected(lambda opcode, _: True))
+        self.assertEqual(lines.split('\n')[:2], ['0,2019-11-12T14:14:09.696Z,true',
+                                                  '1,2019-11-12T14:14:09.696Z,None,4548,4916,24'])
+
+    def test_slow_reader_is_disconnected(self):
+        hub = subscribe.SubscriptionServer(self.path, buffer_size=2)
+        hub.start()
+        slow = self.subscribe(hub, {})
+
+        opcode, event_data, csv_row = [r for r in rows() if r[2] is not None][0]
+        started = time.time()
+        for _ in range(20000):
+            hub.publish(opcode, event_data, csv_row)
+        self.assertLess(time.time() - started, 5)
+
+        wait_for(lambda: not hub.subscribers)
+        received = read_all(slow)
+        self.assertLess(len(received), 20000 * len(csv_row))
+        hub.close()
+
+    def test_check_socket_path(self):
+        regular = os.path.join(self.directory, 'file')
+        open(regular, 'w').close()
+        self.assertRaises(ValueError, subscribe.check_socket_path, regular)
+        self.assertRaises(ValueError, subscribe.SubscriptionServer(regular).start)
+        self.assertTrue(os.path.exists(regular))
+        self.assertRaises(ValueError, subscribe.check_socket_path, os.path.join(self.directory, 'missing', 'x.sock'))
+        self.assertRaises(ValueError, subscribe.check_socket_path, os.path.join(self.directory, 'x' * 120))
+        subscribe.check_socket_path(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'WLBS'
+LENGTH = struct.Struct('<I')
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def check_record_dir(directory):
+    """
+    Raise ValueError unless directory exists and holds no segments, so separate analyses are never mixed.
+    """
+    if not os.path.isdir(directory):
+        raise ValueError('Capture directory does not exist: {}'.format(directory))
+    if glob.glob(os.path.join(directory, 'bulk-*.seg')):
+        raise ValueError('Capture directory already contains a recording: {}'.format(directory))
+
+
+class BulkRecorder(object):
+    """
+    Records raw /_bulk request bodies into segment files so an analysis can be parsed again later.
+
+    A segment starts with MAGIC, followed by records of a little endian 32 bit length and the body. A new segment is
+    started once the current one exceeds segment_size.
+    """
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        check_record_dir(directory)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segment = 0
+        self.f = None
+        self.enabled = True
+        self.lock = threading.Lock()
+
+    def _rotate(self):
+        if self.f:
+            self.f.close()
+        path = os.path.join(self.directory, 'bulk-{:06d}.seg'.format(self.segment))
+        self.segment += 1
+        log.info(' * Recording bulk bodies to {}'.format(path))
+        self.f = open(path, 'wb')
+        self.f.write(MAGIC)
+
+    def record(self, body):
+        with self.lock:
+            if not self.enabled:
+                return
+            if self.f is None or self.f.tell() > self.segment_size:
+                self._rotate()
+            self.f.write(LENGTH.pack(len(body)))
+            self.f.write(body)
+            self.f.flush()
+
+    def close(self):
+        """
+        Stop recording, later calls to record are ignored.
+        """
+        with self.lock:
+            self.enabled = False
+            if self.f:
+                f, self.f = self.f, None
+                f.close()
+
+
+def iter_segment(path):
+    """
+    Yield the recorded bodies of a single segment file, a truncated last record is skipped.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if m[:len(MAGIC)] != MAGIC:
+                raise ValueError('Not a bulk capture segment: {}'.format(path))
+            offset = len(MAGIC)
+            size = len(m)
+            while offset + LENGTH.size <= size:
+                length, = LENGTH.unpack_from(m, offset)
+                offset += LENGTH.size
+                if offset + length > size:
+                    log.warning('Truncated record in {} at offset {}'.format(path, offset))
+                    break
+                yield m[offset:offset + length]
+                offset += length
+        finally:
+            m.close()
+
+
+def iter_segments(directory):
+    """
+    Yield the recorded bodies of all segments in a capture directory, in recording order.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, 'bulk-*.seg'))):
+        for body in iter_segment(path):
+            yield body
@@ -0,0 +1,164 @@
+import json
+import logging
+from collections import defaultdict
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+import parse
+
+log = logging.getLogger(__name__)
+
+KEYS = ('syscall', 'pid', 'process', 'opcode')
+UNKNOWN_PROCESS = '<unknown>'
+
+
+def _process_name(name):
+    return name.rsplit('\\', 1)[-1].lower()
+
+
+def _normalize(key, value):
+    if key == 'process':
+        return _process_name(value)
+    elif key == 'opcode':
+        return int(value)
+    value = str(value)
+    if key == 'syscall' and not value.isdigit():
+        log.warning('Syscall filter value {} is not a number and will never match'.format(value))
+    return value
+
+
+class FilterRules(object):
+    """
+    Pre-write filter for noisy events, compiled into set and dict lookups.
+
+    Every rule section maps a key (syscall, pid, process or opcode) to values, a key is only checked against events
+    carrying it. Syscalls are matched by number as logged in syscall.csv, names are not supported. Process names are matched case-insensitive
+    on the image file name. Thread events name the image of their pid and process events the image of their ppid, so
+    process events match on the name of the creating process and syscall events on the name last seen for their pid.
+    With a process allow list, events of a pid whose name is not known yet are dropped.
+
+    * allow: events must match one of the listed values
+    * deny: events matching a listed value are dropped
+    * rate_limit: value -> maximum events per second, by event timestamp
+    * sample: value -> keep one in every n events
+    """
+
+    def __init__(self, allow=None, deny=None, rate_limit=None, sample=None):
+        self.allow = self._compile('allow', allow)
+        self.deny = self._compile('deny', deny)
+        self.rate_limit = self._compile('rate_limit', rate_limit, minimum=0)
+        self.sample = self._compile('sample', sample, minimum=1)
+
+        self.names = {}
+        self.windows = {}
+        self.counters = defaultdict(int)
+        self.dropped = defaultdict(int)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            if path.endswith(('.yml', '.yaml')):
+                if yaml is None:
+                    raise ValueError('PyYAML is required to read filter rules from {}'.format(path))
+                rules = yaml.safe_load(f)
+            else:
+                rules = json.load(f)
+
+        unknown = set(rules or {}) - {'allow', 'deny', 'rate_limit', 'sample'}
+        if unknown:
+            raise ValueError('Unknown filter rule sections in {}: {}'.format(path, ', '.join(sorted(unknown))))
+        return cls(**(rules or {}))
+
+    @staticmethod
+    def _compile(name, section, minimum=None):
+        """
+        :param minimum: When given, the section maps values to counts that must be at least minimum.
+        """
+        compiled = {}
+        for key, values in (section or {}).items():
+            if key not in KEYS:
+                raise ValueError('Unknown filter key: {}'.format(key))
+            if minimum is None:
+                compiled[key] = frozenset(_normalize(key, v) for v in values)
+                continue
+            counts = {}
+            for v, n in values.items():
+                n = int(n)
+                if n < minimum:
+                    raise ValueError('Filter {} {}={} must be at least {}, got {}'.format(name, key, v, minimum, n))
+                counts[_normalize(key, v)] = n
+            compiled[key] = counts
+        return compiled
+
+    def _fields(self, opcode, event_data):
+        pid = event_data.get('pid')
+        name = event_data.get('name')
+        if name and opcode == parse.EventTypes.THREAD:
+            name = _process_name(name)
+            self.names[pid] = name
+        elif name and opcode == parse.EventTypes.PROCESS:
+            name = _process_name(name)
+            self.names[event_data.get('ppid')] = name
+        else:
+            name = self.names.get(pid)
+        return {'syscall': event_data.get('syscall'), 'pid': pid, 'process': name, 'opcode': opcode}
+
+    def accept(self, opcode, datatime, event_data):
+        """
+        :return: False when the event should not be written.
+        """
+        fields = self._fields(opcode, event_data)
+
+        for key, values in self.allow.items():
+            value = fields[key]
+            if value is None and key == 'process' and fields['pid'] is not None:
+                # No thread event named this pid yet, the process can not be shown to be allowed
+                self.dropped[('allow', key, UNKNOWN_PROCESS)] += 1
+                return False
+            if value is not None and value not in values:
+                self.dropped[('allow', key, value)] += 1
+                return False
+
+        for key, values in self.deny.items():
+            value = fields[key]
+            if value in values:
+                self.dropped[('deny', key, value)] += 1
+                return False
+
+        for key, values in self.rate_limit.items():
+            value = fields[key]
+            limit = values.get(value)
+            if limit is None:
+                continue
+            # Timestamps are ISO 8601, the first 19 characters identify the second
+            second = datatime[:19]
+            window = self.windows.get((key, value))
+            if window is None or window[0] != second:
+                window = [second, 0]
+                self.windows[(key, value)] = window
+            window[1] += 1
+            if window[1] > limit:
+                self.dropped[('rate_limit', key, value)] += 1
+                return False
+
+        for key, values in self.sample.items():
+            value = fields[key]
+            every = values.get(value)
+            if every is None:
+                continue
+            self.counters[(key, value)] += 1
+            if self.counters[(key, value)] % every != 1 % every:
+                self.dropped[('sample', key, value)] += 1
+                return False
+
+        return True
+
+    def report(self):
+        total = sum(self.dropped.values())
+        log.info('Filtered {} events'.format(total))
+        for (rule, key, value), count in sorted(self.dropped.items(), key=lambda i: -i[1]):
+            log.info(' * {} {}={}: {}'.format(rule, key, value, count))
+        return total
@@ -10,55 +10,95 @@ class EventTypes:
     THREAD = 2
     PROCESS = 3
     UNKNOWN = -1
+    FILTERED = -2
 
 
-def parse_csv(data):
+def parse_event(data):
+    """
+    Decode a single bulk document.
+
+    :return: (opcode, timestamp, event_data), opcode is EventTypes.UNKNOWN for other providers.
+    """
+    j = json.loads(data)
+    winlog = j['winlog']
+    if not winlog['provider_name'] == 'Call Logger':
+        return EventTypes.UNKNOWN, None, None
+
+    event_data = winlog['event_data']
+    return int(event_data['opcode']), j['@timestamp'], event_data
+
+
+def parse_csv(data, rules=None):
+    opcode, _, csv_row = parse_row(data, rules)
+    return opcode, csv_row
+
+
+def parse_row(data, rules=None):
+    """
+    Parse a single bulk document into its csv row, keeping the decoded event data.
+
+    :param rules: Optional filters.FilterRules, rejected events are returned as EventTypes.FILTERED without a row.
+    :return: (opcode, event_data, csv_row)
+    """
     try:
-        j = json.loads(data)
-        winlog = j['winlog']
-        if not winlog['provider_name'] == 'Call Logger':
-            return EventTypes.UNKNOWN, None
-
-        datatime = j['@timestamp']
-        event_data = winlog['event_data']
-
-        csv_row = '{}'.format(datatime)
-        opcode = int(event_data['opcode'])
-        if opcode == EventTypes.SYSCALL:
-            ppid = event_data.get('ppid')
-            pid = event_data.get('pid')
-            tid = event_data.get('tid')
-            syscall = event_data.get('syscall')
-            csv_row += ',{},{},{},{}\n'.format(ppid, pid, tid, syscall)
-            return opcode, csv_row
-        elif opcode == EventTypes.THREAD:
-            try:
-                name = event_data.get('name').encode('ascii')
-            except:
-                name = ''
-            ppid = event_data.get('ppid')
-            pid = event_data.get('pid')
-            tid = event_data.get('tid')
-            newtid = event_data.get('newtid')
-            created = event_data.get('created')
-            csv_row += ',"{}",{},{},{},{},{}\n'.format(name, ppid, pid, tid, newtid, created)
-            return opcode, csv_row
-        elif opcode == EventTypes.PROCESS:
-            try:
-                name = event_data.get('name').encode('ascii')
-            except:
-                name = ''
-            ppid = event_data.get('ppid')
-            pid = event_data.get('pid')
-            tid = event_data.get('tid')
-            created = event_data.get('created')
-            csv_row += ',"{}",{},{},{},{}\n'.format(name, ppid, pid, tid, created)
-            return opcode, csv_row
-        elif opcode == EventTypes.STATUS:
-            status = event_data.get('logging_started')
-            csv_row += ',{}\n'.format(status)
-            return opcode, csv_row
-        else:
-            return opcode, None
+        opcode, datatime, event_data = parse_event(data)
     except Exception as e:
         log.error(u'Failed to parse {}: {}'.format(data, e))
+        return EventTypes.UNKNOWN, None, None
+
+    if rules is not None and opcode != EventTypes.UNKNOWN:
+        try:
+            if not rules.accept(opcode, datatime, event_data):
+                return EventTypes.FILTERED, event_data, None
+        except Exception as e:
+            # Keep the event, a broken rule should not lose data
+            log.error(u'Failed to apply filter rules to {}: {}'.format(event_data, e))
+
+    try:
+        return opcode, event_data, format_csv(opcode, datatime, event_data)
+    except Exception as e:
+        log.error(u'Failed to parse {}: {}'.format(data, e))
+        return EventTypes.UNKNOWN, None, None
+
+
+def format_csv(opcode, datatime, event_data):
+    if opcode == EventTypes.UNKNOWN:
+        return None
+
+    csv_row = '{}'.format(datatime)
+    if opcode == EventTypes.SYSCALL:
+        ppid = event_data.get('ppid')
+        pid = event_data.get('pid')
+        tid = event_data.get('tid')
+        syscall = event_data.get('syscall')
+        csv_row += ',{},{},{},{}\n'.format(ppid, pid, tid, syscall)
+        return csv_row
+    elif opcode == EventTypes.THREAD:
+        try:
+            name = event_data.get('name').encode('ascii')
+        except:
+            name = ''
+        ppid = event_data.get('ppid')
+        pid = event_data.get('pid')
+        tid = event_data.get('tid')
+        newtid = event_data.get('newtid')
+        created = event_data.get('created')
+        csv_row += ',"{}",{},{},{},{},{}\n'.format(name, ppid, pid, tid, newtid, created)
+        return csv_row
+    elif opcode == EventTypes.PROCESS:
+        try:
+            name = event_data.get('name').encode('ascii')
+        except:
+            name = ''
+        ppid = event_data.get('ppid')
+        pid = event_data.get('pid')
+        tid = event_data.get('tid')
+        created = event_data.get('created')
+        csv_row += ',"{}",{},{},{},{}\n'.format(name, ppid, pid, tid, created)
+        return csv_row
+    elif opcode == EventTypes.STATUS:
+        status = event_data.get('logging_started')
+        csv_row += ',{}\n'.format(status)
+        return csv_row
+    else:
+        return None
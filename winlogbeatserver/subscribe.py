@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import socket
+import stat
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+log = logging.getLogger(__name__)
+
+# Size of sun_path on Linux, without the terminating null byte
+MAX_PATH = 107
+
+
+def check_socket_path(path):
+    """
+    Raise ValueError when path can not be used to listen on.
+    """
+    if len(path) > MAX_PATH:
+        raise ValueError('Socket path longer than {} characters: {}'.format(MAX_PATH, path))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+        raise ValueError('Socket directory does not exist: {}'.format(path))
+    if os.path.exists(path) and not stat.S_ISSOCK(os.stat(path).st_mode):
+        raise ValueError('Socket path exists and is not a socket: {}'.format(path))
+
+
+def _remove_socket(path):
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError('Refusing to remove {}, it is not a socket'.format(path))
+    os.unlink(path)
+
+
+class Subscriber(object):
+    """
+    A single connected reader. Frames are buffered in a bounded queue and sent by a dedicated thread, a reader that
+    lets the buffer fill up is disconnected instead of stalling the parse process.
+    """
+
+    def __init__(self, conn, types=None, pids=None, buffer_size=1024):
+        self.conn = conn
+        self.types = frozenset(int(t) for t in types) if types else None
+        self.pids = frozenset(str(p) for p in pids) if pids else None
+        self.queue = queue.Queue(buffer_size)
+        self.closed = False
+        self.done = threading.Event()
+
+    def wants(self, opcode, pid):
+        if self.types is not None and opcode not in self.types:
+            return False
+        if self.pids is not None and pid not in self.pids:
+            return False
+        return True
+
+    def offer(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self, flush=False):
+        """
+        :param flush: Send the buffered frames before disconnecting, a full buffer is dropped regardless.
+        """
+        if not self.closed:
+            self.closed = True
+            try:
+                self.queue.put_nowait(None)
+                if flush:
+                    return
+            except queue.Full:
+                pass
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def run(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                if not isinstance(frame, bytes):
+                    frame = frame.encode('utf-8')
+                self.conn.sendall(frame)
+        except socket.error as e:
+            log.info('Subscriber disconnected: {}'.format(e))
+        finally:
+            self.closed = True
+            self.conn.close()
+            self.done.set()
+
+
+class SubscriptionServer(object):
+    """
+    Streams parsed events over a Unix domain socket while the analysis is running.
+
+    A client connects and sends a single JSON line selecting what it wants, e.g. {"types": [1], "pids": [2532]}.
+    Omitted or empty keys select everything, events without a pid (status) are skipped when pids are given.
+    Every matching event is then sent as one line: the opcode followed by the row as written to the csv files.
+    """
+
+    def __init__(self, path, buffer_size=1024):
+        """
+        :param path: Path of the Unix domain socket to listen on.
+        :param buffer_size: Maximum number of frames buffered per subscriber before it is disconnected.
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def start(self):
+        check_socket_path(self.path)
+        _remove_socket(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(5)
+        log.info(' * Event subscriptions on {}'.format(self.path))
+
+        t = threading.Thread(target=self._accept)
+        t.daemon = True
+        t.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            t = threading.Thread(target=self._serve, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def _serve(self, conn):
+        try:
+            conn.settimeout(5)
+            line = conn.makefile('rb').readline(4096)
+            conn.settimeout(None)
+            selection = json.loads(line.decode('utf-8')) if line.strip() else {}
+            subscriber = Subscriber(conn, selection.get('types'), selection.get('pids'), self.buffer_size)
+        except Exception as e:
+            log.warning('Invalid event subscription: {}'.format(e))
+            conn.close()
+            return
+
+        with self.lock:
+            self.subscribers.append(subscriber)
+        log.info('Event subscriber connected, {} active'.format(len(self.subscribers)))
+        subscriber.run()
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, opcode, event_data, csv_row):
+        if not self.subscribers or csv_row is None:
+            return
+
+        pid = event_data.get('pid')
+        frame = '{},{}'.format(opcode, csv_row)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for s in subscribers:
+            if s.closed or not s.wants(opcode, pid):
+                continue
+            if not s.offer(frame):
+                log.warning('Event subscriber too slow, disconnecting')
+                s.close()
+
+    def close(self, timeout=5):
+        """
+        :param timeout: Seconds to wait for each subscriber to receive its buffered events.
+        """
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for s in subscribers:
+            s.close(flush=True)
+        for s in subscribers:
+            if not s.done.wait(timeout):
+                log.warning('Event subscriber did not receive all events before closing')
+                s.close()
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        _remove_socket(self.path)
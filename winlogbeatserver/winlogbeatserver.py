@@ -14,8 +14,11 @@ from flask import Flask
 from flask import request
 from flask_restful import Resource, Api
 
+import capture
+import filters
 import parse
 import responses
+import subscribe
 
 log = logging.getLogger(__name__)
 
@@ -44,59 +47,134 @@ filename_syscall = 'syscall.csv'
 filename_status = 'status.csv'
 
 
-def write_log(queue_data, base_path):
-    log.info(' * Write log process started')
-    log.info(' * Writing to {}'.format(base_path))
+def _log_paths(base_path):
     if not os.path.exists(base_path):
         raise ValueError('Save directory does not exist: {}'.format(base_path))
 
-    path_thread = os.path.join(base_path, filename_thread)
-    path_process = os.path.join(base_path, filename_process)
-    path_syscall = os.path.join(base_path, filename_syscall)
-    path_status = os.path.join(base_path, filename_status)
-    
+    return (os.path.join(base_path, filename_thread),
+            os.path.join(base_path, filename_process),
+            os.path.join(base_path, filename_syscall),
+            os.path.join(base_path, filename_status))
+
+
+def write_log(queue_data, base_path, socket_path=None, rules=None):
+    log.info(' * Write log process started')
+    log.info(' * Writing to {}'.format(base_path))
+    paths = _log_paths(base_path)
+
+    hub = None
+    if socket_path:
+        hub = subscribe.SubscriptionServer(socket_path)
+        try:
+            hub.start()
+        except Exception as e:
+            # The csv files are the main output, keep writing them without the live stream
+            log.error('Unable to stream events on {}: {}'.format(socket_path, e))
+            hub = None
+
+    try:
+        _write_log(_queue_documents(queue_data), hub, rules, *paths)
+    finally:
+        if hub:
+            hub.close()
+        if rules:
+            rules.report()
+
+
+def replay(capture_dir, base_path, rules=None):
+    """
+    Parse a capture recorded with --record straight into the csv files, without the HTTP server.
+
+    :return: Number of bulk documents replayed.
+    """
+    log.info(' * Replaying {} to {}'.format(capture_dir, base_path))
+    paths = _log_paths(base_path)
+
+    documents = (d for body in capture.iter_segments(capture_dir) for d in bulk_documents(body))
+
+    started = time.time()
+    try:
+        count = _write_log(documents, None, rules, *paths)
+    finally:
+        if rules:
+            rules.report()
+
+    elapsed = time.time() - started
+    log.info('Replayed {} documents in {:.2f}s ({:.0f} documents/s)'.format(
+        count, elapsed, count / elapsed if elapsed else 0))
+    return count
+
+
+def _queue_documents(queue_data):
+    started_waiting = time.time()
+    logcount = 0
+    while True:
+        if not queue_data.empty():
+            logcount += 1
+            started_waiting = time.time()
+            d = queue_data.get_nowait()
+            if logcount > 500:
+                log.info('Processing Winlogbeat queue element, queue size: {}'.format(queue_data.qsize()))
+                logcount = 0
+            yield d
+        if time.time() - started_waiting > 60:
+            log.info('Wineventlog timeout waiting for data')
+            return
+
+
+def _write_log(documents, hub, rules, path_thread, path_process, path_syscall, path_status):
     with open(path_thread, 'w') as thread_f, \
             open(path_process, 'w') as process_f, \
             open(path_syscall, 'w') as syscall_f, \
             open(path_status, 'w', buffering=0) as status_f:
 
-        started_waiting = time.time()
-        logcount = 0
-        while True:
-            if not queue_data.empty():
-                logcount += 1
-                started_waiting = time.time()
-                d = queue_data.get_nowait()
-                if logcount > 500:
-                    log.info('Processing Winlogbeat queue element, queue size: {}'.format(queue_data.qsize()))
-                    logcount = 0
-                type, p = parse.parse_csv(d)
-                if type == parse.EventTypes.UNKNOWN:
-                    continue
-                elif type == parse.EventTypes.THREAD:
-                    thread_f.write(p)
-                elif type == parse.EventTypes.PROCESS:
-                    process_f.write(p)
-                elif type == parse.EventTypes.SYSCALL:
-                    syscall_f.write(p)
-                elif type == parse.EventTypes.STATUS:
-                    logging.info('Found status')
-                    status_f.write(p)
-            if time.time() - started_waiting > 60:
-                log.info('Wineventlog timeout waiting for data')
-                return
+        count = 0
+        for d in documents:
+            count += 1
+            type, event_data, p = parse.parse_row(d, rules)
+            if hub:
+                hub.publish(type, event_data, p)
+            if type in (parse.EventTypes.UNKNOWN, parse.EventTypes.FILTERED):
+                continue
+            elif type == parse.EventTypes.THREAD:
+                thread_f.write(p)
+            elif type == parse.EventTypes.PROCESS:
+                process_f.write(p)
+            elif type == parse.EventTypes.SYSCALL:
+                syscall_f.write(p)
+            elif type == parse.EventTypes.STATUS:
+                logging.info('Found status')
+                status_f.write(p)
+        return count
+
+
+def bulk_documents(data):
+    for d in data.decode('utf-8').rstrip().split('\n'):
+        # Do use the document 'header'
+        if len(d) > 100:
+            yield d
 
 
 class Bulk(Resource):
-    def __init__(self, queue_data):
+    def __init__(self, queue_data, recorder=None):
         self.queue_data = queue_data
+        self.recorder = recorder
 
     def post(self):
-        data = request.get_data().decode('utf-8').rstrip().split('\n')
-        for d in data:
-            # Do use the document 'header'
-            if len(d) > 100:
-                self.queue_data.put(d)
+        data = request.get_data()
+        for d in bulk_documents(data):
+            self.queue_data.put(d)
+
+        if self.recorder:
+            try:
+                self.recorder.record(data)
+            except Exception as e:
+                # Recording is optional, never let it fail the live capture
+                log.error('Failed to record bulk body, recording stopped: {}'.format(e))
+                try:
+                    self.recorder.close()
+                except Exception:
+                    pass
 
 
 class Template(Resource):
@@ -127,7 +205,9 @@ class Shutdown(Resource):
         func()
 
 
-def start_flask(queue, kwargs):
+def start_flask(queue, kwargs, record_dir=None):
+    recorder = capture.BulkRecorder(record_dir) if record_dir else None
+
     app = Flask('Winlogbeatserver')
     api = Api(app)
 
@@ -136,23 +216,37 @@ def start_flask(queue, kwargs):
     api.add_resource(Policy, '/_ilm/policy/winlogbeat-7.4.2')
     api.add_resource(Template, '/_template/winlogbeat-7.4.2')
     api.add_resource(WinlogbeatNow, '/<winlogbeat-7.4.2-{now/d}-000001>')
-    api.add_resource(Bulk, '/_bulk', resource_class_kwargs=queue)
+    api.add_resource(Bulk, '/_bulk', resource_class_kwargs=dict(queue, recorder=recorder))
     api.add_resource(Shutdown, '/shutdown')
 
-    return app.run(**kwargs)
+    try:
+        return app.run(**kwargs)
+    finally:
+        if recorder:
+            recorder.close()
 
 
 class WinlogBeat:
 
-    def __init__(self, output_dir, debug=True, port=5000):
+    def __init__(self, output_dir, debug=True, port=5000, socket_path=None, rules_path=None, record_dir=None):
         """
         :param output_dir: Directory to write the csv files to.
+        :param socket_path: Unix domain socket to stream parsed events on, disabled when None.
+        :param rules_path: JSON or YAML file with filter rules applied before writing, see filters.FilterRules.
+        :param record_dir: Directory to record raw bulk bodies to for replay, disabled when None.
         """
         self.main_process = None
         self.parse_process = None
         self.output_dir = output_dir
         self.debug = debug
         self.port = port
+        if socket_path:
+            subscribe.check_socket_path(socket_path)
+        self.socket_path = socket_path
+        if record_dir:
+            capture.check_record_dir(record_dir)
+        self.record_dir = record_dir
+        self.rules = filters.FilterRules.from_file(rules_path) if rules_path else None
         self.queue = Queue()
 
     def start(self):
@@ -167,12 +261,12 @@ class WinlogBeat:
             'port': self.port
         }
 
-        self.main_process = Process(target=start_flask, args=({'queue_data': self.queue}, kwargs))
+        self.main_process = Process(target=start_flask, args=({'queue_data': self.queue}, kwargs, self.record_dir))
 
         self.main_process.start()
         log.info('Main process pid {}'.format(self.main_process.pid))
 
-        self.parse_process = Process(target=write_log, args=(self.queue, self.output_dir))
+        self.parse_process = Process(target=write_log, args=(self.queue, self.output_dir, self.socket_path, self.rules))
 
         self.parse_process.start()
         log.info('Parse process pid {}'.format(self.parse_process.pid))
@@ -211,16 +305,9 @@ class WinlogBeat:
             except OSError:
                 log.warning('Winlogbeat parse process PID does not exist')
 
-        path_thread = os.path.join(self.output_dir, filename_thread)
-        path_process = os.path.join(self.output_dir, filename_process)
-        path_syscall = os.path.join(self.output_dir, filename_syscall)
-        path_status = os.path.join(self.output_dir, filename_status)
-
         if compress:
-            self.compress(path_thread)
-            self.compress(path_process)
-            self.compress(path_syscall)
-            self.compress(path_status)
+            for path in _log_paths(self.output_dir):
+                self.compress(path)
 
     @staticmethod
     def compress(filename):
@@ -251,6 +338,14 @@ def parse_args():
                         help='Enable debug')
     parser.add_argument('--debug', action='store_true',
                         help='Enable debug')
+    parser.add_argument('--socket', type=str,
+                        help='Unix domain socket to stream parsed events on')
+    parser.add_argument('--rules', type=str,
+                        help='JSON or YAML file with filter rules')
+    parser.add_argument('--record', type=str,
+                        help='Directory to record raw bulk bodies to')
+    parser.add_argument('--replay', type=str,
+                        help='Replay bulk bodies recorded with --record to the output directory and exit')
     args = parser.parse_args()
     return args
 
@@ -263,7 +358,13 @@ def main():
     else:
         logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
-    wlb = WinlogBeat(args.out, debug=args.debug)
+    if args.replay:
+        rules = filters.FilterRules.from_file(args.rules) if args.rules else None
+        replay(args.replay, args.out, rules)
+        return
+
+    wlb = WinlogBeat(args.out, debug=args.debug, socket_path=args.socket, rules_path=args.rules,
+                     record_dir=args.record)
 
     try:
         wlb.start()